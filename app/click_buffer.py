@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, update
+
+from app.database import URL, Click, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.1  # seconds
+
+# Queued by stop() behind any pending rows to tell the flusher to finish up
+_STOP = object()
+
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_queue: Optional[asyncio.Queue] = None
+_task: Optional[asyncio.Task] = None
+
+def write_batch(rows: List[Dict]):
+    """Insert a batch of clicks and bump each URL's counter in one transaction"""
+    db = SessionLocal()
+    try:
+        db.execute(insert(Click), rows)
+        for short_code, count in Counter(row["short_code"] for row in rows).items():
+            db.execute(
+                update(URL)
+                .where(URL.short_code == short_code)
+                .values(click_count=URL.click_count + count)
+            )
+        db.commit()
+    finally:
+        db.close()
+
+def enqueue(row: Dict):
+    """Buffer a click row; safe to call from any thread"""
+    with _lock:
+        if _loop is not None and _queue is not None:
+            _loop.call_soon_threadsafe(_queue.put_nowait, row)
+            return
+    # Flusher isn't running, write straight through
+    write_batch([row])
+
+async def _write(rows: List[Dict]):
+    try:
+        await run_in_threadpool(write_batch, rows)
+    except Exception:
+        # Don't stop tracking because one batch failed
+        logger.exception("Failed to write %d buffered clicks", len(rows))
+
+async def _flusher():
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        row = await _queue.get()
+        if row is _STOP:
+            break
+        rows = [row]
+        deadline = loop.time() + FLUSH_INTERVAL
+        while len(rows) < BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if row is _STOP:
+                stopping = True
+                break
+            rows.append(row)
+        await _write(rows)
+
+async def start():
+    """Start the background flusher on the running event loop"""
+    global _loop, _queue, _task
+    _queue = asyncio.Queue()
+    _task = asyncio.create_task(_flusher())
+    with _lock:
+        _loop = asyncio.get_running_loop()
+
+async def stop():
+    """Stop the flusher once everything buffered so far has been written"""
+    global _loop, _task
+    with _lock:
+        loop, _loop = _loop, None
+    if loop is None:
+        return
+    # call_soon is FIFO, so the sentinel lands behind rows that enqueue()
+    # already scheduled with call_soon_threadsafe
+    loop.call_soon(_queue.put_nowait, _STOP)
+    await _task
+    _task = None
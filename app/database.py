@@ -1,5 +1,7 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean
+from sqlalchemy import create_engine, event, Column, Index, Integer, String, DateTime, Boolean
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
+from typing import Any
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import os
@@ -9,10 +11,46 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./nexus.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+if DATABASE_URL.startswith("sqlite"):
+    sqlite_kwargs = {}
+    # In-memory databases use SingletonThreadPool, which takes no sizing;
+    # file databases get a QueuePool like any other backend
+    if make_url(DATABASE_URL).database not in (None, "", ":memory:"):
+        sqlite_kwargs = {"pool_size": 20, "max_overflow": 10, "pool_timeout": 30}
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        **sqlite_kwargs
+    )
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _):
+        """Use WAL so click writes don't block concurrent reads"""
+        cursor = dbapi_conn.cursor()
+        for pragma in (
+            "journal_mode=WAL",
+            "synchronous=NORMAL",
+            "temp_store=MEMORY",
+            "mmap_size=268435456",
+            "cache_size=-64000",
+            "busy_timeout=5000",
+        ):
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=20,
+        max_overflow=10,
+        pool_timeout=30,
+        pool_recycle=3600,
+        pool_pre_ping=True,
+        pool_use_lifo=True
+    )
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
+Base: Any = declarative_base()
 
 class URL(Base):
     __tablename__ = "urls"
@@ -25,6 +63,10 @@ class URL(Base):
     is_active = Column(Boolean, default=True)
     creator_ip = Column(String)
 
+    __table_args__ = (
+        Index("ix_urls_short_code_active", "short_code", "is_active"),
+    )
+
 class Click(Base):
     __tablename__ = "clicks"
 
@@ -37,6 +79,10 @@ class Click(Base):
     country = Column(String)
     city = Column(String)
 
+    __table_args__ = (
+        Index("ix_clicks_short_code_clicked_at", "short_code", "clicked_at"),
+    )
+
 def get_db():
     db = SessionLocal()
     try:
@@ -44,4 +90,10 @@ def get_db():
     finally:
         db.close()
 
-Base.metadata.create_all(bind=engine)
+def init_db():
+    """Create missing tables and indexes"""
+    Base.metadata.create_all(bind=engine)
+    # create_all skips indexes on tables that already exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
@@ -1,11 +1,14 @@
-from fastapi import FastAPI, HTTPException, Depends, Request, status
+from fastapi import FastAPI, HTTPException, Depends, Request, BackgroundTasks, status
 from fastapi.responses import RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 import os
 from dotenv import load_dotenv
 
-from app.database import get_db
+from app import click_buffer
+from app.database import get_db, init_db
+from app.middleware import rate_limiter
 from app.schemas import URLCreate, URLResponse, AnalyticsResponse
 from app.services import URLService, AnalyticsService
 
@@ -27,6 +30,23 @@ app.add_middleware(
 )
 
 BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
+_prefix = BASE_URL + "/"
+
+@app.on_event("startup")
+def _init_db():
+    init_db()
+
+@app.on_event("startup")
+async def _start_click_buffer():
+    await click_buffer.start()
+
+@app.on_event("shutdown")
+async def _stop_click_buffer():
+    await click_buffer.stop()
+
+@app.on_event("shutdown")
+async def _close_rate_limiter():
+    await rate_limiter.close()
 
 @app.get("/")
 async def root():
@@ -38,7 +58,7 @@ async def root():
     }
 
 @app.post("/shorten", response_model=URLResponse)
-async def create_short_url(
+def create_short_url(
     url_data: URLCreate,
     request: Request,
     db: Session = Depends(get_db)
@@ -57,7 +77,7 @@ async def create_short_url(
             id=url_obj.id,
             original_url=url_obj.original_url,
             short_code=url_obj.short_code,
-            short_url=f"{BASE_URL}/{url_obj.short_code}",
+            short_url=_prefix + url_obj.short_code,
             created_at=url_obj.created_at,
             click_count=url_obj.click_count,
             is_active=url_obj.is_active
@@ -67,10 +87,18 @@ async def create_short_url(
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
+def _track_click(**kwargs):
+    try:
+        AnalyticsService.track_click(**kwargs)
+    except Exception:
+        # Don't fail redirect if analytics tracking fails
+        pass
+
 @app.get("/{short_code}")
-async def redirect_url(
+def redirect_url(
     short_code: str,
     request: Request,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """Redirect to original URL and track analytics"""
@@ -79,29 +107,24 @@ async def redirect_url(
     if not url_obj:
         raise HTTPException(status_code=404, detail="Short URL not found")
     
-    # Track the click
-    try:
-        ip_address = request.client.host
-        user_agent = request.headers.get("user-agent", "")
-        referer = request.headers.get("referer")
-        
-        AnalyticsService.track_click(
-            db=db,
-            short_code=short_code,
-            ip_address=ip_address,
-            user_agent=user_agent,
-            referer=referer
-        )
-    except Exception:
-        # Don't fail redirect if analytics tracking fails
-        pass
+    # Track the click after the response has been sent
+    ip_address = request.client.host
+    user_agent = request.headers.get("user-agent", "")
+    referer = request.headers.get("referer")
+    background_tasks.add_task(
+        _track_click,
+        short_code=short_code,
+        ip_address=ip_address,
+        user_agent=user_agent,
+        referer=referer
+    )
     
     return RedirectResponse(url=url_obj.original_url, status_code=302)
 
 @app.get("/api/urls/{short_code}", response_model=URLResponse)
-async def get_url_info(short_code: str, db: Session = Depends(get_db)):
+def get_url_info(short_code: str, db: Session = Depends(get_db)):
     """Get URL information without redirecting"""
-    url_obj = URLService.get_url_by_code(db, short_code)
+    url_obj = URLService.get_url_details(db, short_code)
     
     if not url_obj:
         raise HTTPException(status_code=404, detail="Short URL not found")
@@ -110,14 +133,14 @@ async def get_url_info(short_code: str, db: Session = Depends(get_db)):
         id=url_obj.id,
         original_url=url_obj.original_url,
         short_code=url_obj.short_code,
-        short_url=f"{BASE_URL}/{url_obj.short_code}",
+        short_url=_prefix + url_obj.short_code,
         created_at=url_obj.created_at,
         click_count=url_obj.click_count,
         is_active=url_obj.is_active
     )
 
 @app.get("/api/analytics/{short_code}", response_model=AnalyticsResponse)
-async def get_analytics(short_code: str, db: Session = Depends(get_db)):
+def get_analytics(short_code: str, db: Session = Depends(get_db)):
     """Get detailed analytics for a short URL"""
     # Verify URL exists
     url_obj = URLService.get_url_by_code(db, short_code)
@@ -129,26 +152,25 @@ async def get_analytics(short_code: str, db: Session = Depends(get_db)):
     return AnalyticsResponse(**analytics_data)
 
 @app.get("/api/urls")
-async def list_urls(
+def list_urls(
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(get_db)
 ):
     """List all URLs (for admin purposes)"""
     from app.database import URL
-    urls = db.query(URL).offset(skip).limit(limit).all()
+    rows = db.execute(
+        select(
+            URL.id, URL.original_url, URL.short_code,
+            URL.created_at, URL.click_count, URL.is_active
+        ).offset(skip).limit(limit)
+    ).all()
     
+    # Plain dicts skip ORM instances and per-row model validation
+    prefix = _prefix
     return [
-        URLResponse(
-            id=url.id,
-            original_url=url.original_url,
-            short_code=url.short_code,
-            short_url=f"{BASE_URL}/{url.short_code}",
-            created_at=url.created_at,
-            click_count=url.click_count,
-            is_active=url.is_active
-        )
-        for url in urls
+        {**row._mapping, "short_url": prefix + row.short_code}
+        for row in rows
     ]
 
 if __name__ == "__main__":
@@ -1,80 +1,144 @@
 from fastapi import Request, HTTPException
 from fastapi.responses import JSONResponse
 import time
-import redis
-from typing import Dict
+import redis.asyncio as redis
+from redis.exceptions import NoScriptError, RedisError
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, cast
 import os
 from dotenv import load_dotenv
 
+from app.redis_backoff import RedisBackoff
+
 load_dotenv()
 
+# Sliding-window counter: weight the previous fixed window's count by how
+# much of it still overlaps the sliding window, and only count the request
+# when the estimate is under the limit
+RATE_LIMIT_LUA = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local current = tonumber(redis.call('GET', KEYS[1]) or 0)
+local previous = tonumber(redis.call('GET', KEYS[2]) or 0)
+local count = current + math.floor(previous * (1 - (now % window) / window))
+if count >= limit then
+    return {0, count}
+end
+if redis.call('INCR', KEYS[1]) == 1 then
+    redis.call('EXPIRE', KEYS[1], window * 2)
+end
+return {1, count + 1}
+"""
+
+MEMORY_PRUNE_INTERVAL = 1000
+
 class RateLimiter:
-    def __init__(self):
-        try:
-            redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-            self.redis_client = redis.from_url(redis_url, decode_responses=True)
-            self.redis_available = True
-        except:
-            self.redis_client = None
-            self.redis_available = False
-            # Fallback to in-memory storage
-            self.memory_store: Dict[str, Dict] = {}
+    def __init__(self) -> None:
+        # Fallback to in-memory storage when Redis is unreachable
+        self.memory_store: Dict[str, Deque[int]] = {}
+        self._memory_calls: int = 0
+        # Loaded on first use, the async client can't talk to Redis here
+        self._sha: Optional[str] = None
+        # Pool and client are created lazily on the first Redis check
+        self.redis_url: str = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self._pool: Optional[redis.ConnectionPool] = None
+        self._client: Optional[redis.Redis] = None
+        self._backoff = RedisBackoff()
     
-    async def check_rate_limit(self, request: Request, max_requests: int = 10, window_seconds: int = 60):
+    def _get_client(self) -> Optional[redis.Redis]:
+        """Return the Redis client, or None while backing off after a failure"""
+        if not self._backoff.available():
+            return None
+        if self._client is None:
+            try:
+                # Replies are integers, so skip decoding them to str
+                self._pool = redis.ConnectionPool.from_url(
+                    self.redis_url,
+                    health_check_interval=30,
+                    socket_timeout=0.2
+                )
+            except ValueError:
+                self._backoff.failed()
+                return None
+            self._client = redis.Redis(connection_pool=self._pool)
+        return self._client
+    
+    async def check_rate_limit(self, request: Request, max_requests: int = 10, window_seconds: int = 60) -> None:
         """Check if client has exceeded rate limit"""
-        client_ip = request.client.host
+        client_ip = request.client.host if request.client else "unknown"
         current_time = int(time.time())
         window_start = current_time - window_seconds
         
-        if self.redis_available and self.redis_client:
+        client = self._get_client()
+        if client is not None:
             try:
                 # Use Redis for distributed rate limiting
-                key = f"rate_limit:{client_ip}"
-                pipe = self.redis_client.pipeline()
-                
-                # Remove old entries
-                pipe.zremrangebyscore(key, 0, window_start)
-                # Add current request
-                pipe.zadd(key, {str(current_time): current_time})
-                # Count requests in window
-                pipe.zcard(key)
-                # Set expiration
-                pipe.expire(key, window_seconds)
-                
-                results = pipe.execute()
-                request_count = results[2]
-                
-                if request_count > max_requests:
-                    raise HTTPException(
-                        status_code=429,
-                        detail=f"Rate limit exceeded. Max {max_requests} requests per {window_seconds} seconds."
-                    )
-            except redis.RedisError:
+                window_id = current_time // window_seconds
+                keys = (f"rl:{client_ip}:{window_id}", f"rl:{client_ip}:{window_id - 1}")
+                args = (current_time, window_seconds, max_requests)
+                # redis-py's stubs don't model the asyncio client's return types
+                evalsha = cast(Callable[..., Awaitable[List[int]]], client.evalsha)
+                sha = self._sha
+                if sha is None:
+                    sha = self._sha = await cast(Awaitable[str], client.script_load(RATE_LIMIT_LUA))
+                try:
+                    allowed, request_count = await evalsha(sha, 2, *keys, *args)
+                except NoScriptError:
+                    # Script cache was flushed (e.g. Redis restart), load it again
+                    sha = self._sha = await cast(Awaitable[str], client.script_load(RATE_LIMIT_LUA))
+                    allowed, request_count = await evalsha(sha, 2, *keys, *args)
+                self._backoff.succeeded()
+            except RedisError:
                 # Fallback to memory storage if Redis fails
+                self._backoff.failed()
                 self._check_memory_rate_limit(client_ip, current_time, window_start, max_requests)
+                return
+            
+            if not allowed:
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Rate limit exceeded. Max {max_requests} requests per {window_seconds} seconds."
+                )
         else:
             # Use in-memory storage
             self._check_memory_rate_limit(client_ip, current_time, window_start, max_requests)
     
-    def _check_memory_rate_limit(self, client_ip: str, current_time: int, window_start: int, max_requests: int):
+    def _check_memory_rate_limit(self, client_ip: str, current_time: int, window_start: int, max_requests: int) -> None:
         """Fallback rate limiting using memory"""
-        if client_ip not in self.memory_store:
-            self.memory_store[client_ip] = {"requests": []}
+        # Periodically drop idle IPs so the store doesn't grow without bound
+        self._memory_calls += 1
+        if self._memory_calls % MEMORY_PRUNE_INTERVAL == 0:
+            for ip in [ip for ip, dq in self.memory_store.items() if not dq or dq[-1] <= window_start]:
+                del self.memory_store[ip]
+        
+        # Only the newest max_requests + 1 timestamps matter for the check
+        requests: Optional[Deque[int]] = self.memory_store.get(client_ip)
+        if requests is None or requests.maxlen != max_requests + 1:
+            requests = deque(requests or (), maxlen=max_requests + 1)
+            self.memory_store[client_ip] = requests
         
         # Clean old requests
-        self.memory_store[client_ip]["requests"] = [
-            req_time for req_time in self.memory_store[client_ip]["requests"]
-            if req_time > window_start
-        ]
+        while requests and requests[0] <= window_start:
+            requests.popleft()
         
         # Add current request
-        self.memory_store[client_ip]["requests"].append(current_time)
+        requests.append(current_time)
         
-        if len(self.memory_store[client_ip]["requests"]) > max_requests:
+        if len(requests) > max_requests:
             raise HTTPException(
                 status_code=429,
                 detail=f"Rate limit exceeded. Max {max_requests} requests per minute."
             )
 
+    async def close(self) -> None:
+        """Release the Redis connection pool"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._pool is not None:
+            await self._pool.disconnect()
+            self._pool = None
+
 # Global rate limiter instance
 rate_limiter = RateLimiter()
@@ -0,0 +1,24 @@
+import time
+
+# Back off from Redis after a failure instead of giving up on it for good
+REDIS_RETRY_MIN = 1.0  # seconds
+REDIS_RETRY_MAX = 60.0
+
+class RedisBackoff:
+    """Tracks when Redis may be tried again after a failure"""
+
+    def __init__(self) -> None:
+        self._retry_at: float = 0.0
+        self._backoff: float = 0.0
+
+    def available(self) -> bool:
+        """Whether Redis should be tried right now"""
+        return time.monotonic() >= self._retry_at
+
+    def failed(self) -> None:
+        """Skip Redis for an exponentially growing interval"""
+        self._backoff = min(self._backoff * 2 or REDIS_RETRY_MIN, REDIS_RETRY_MAX)
+        self._retry_at = time.monotonic() + self._backoff
+
+    def succeeded(self) -> None:
+        self._backoff = 0.0
@@ -1,90 +1,175 @@
-import string
-import random
-import validators
+import base64
+import functools
+import secrets
+import threading
+import os
+import re
+import redis
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from collections import Counter
+from sqlalchemy import case, func, desc, select
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, NamedTuple
+import cachetools
 import user_agents
 
+from app import click_buffer
 from app.database import URL, Click
+from app.redis_backoff import RedisBackoff
+
+MAX_CODE_ATTEMPTS = 8
+
+# Cheap sanity check; endpoints already validate with Pydantic's HttpUrl
+_URL_RE = re.compile(r"^https?://[^\s/$.?#].[^\s]*$", re.IGNORECASE)
+
+class CachedURL(NamedTuple):
+    """What a redirect needs from an active URL row"""
+    original_url: str
+    short_code: str
+
+# Hot short codes are served from memory. Only fields that don't change after
+# creation are cached, so counters are always read from the database.
+_url_cache: cachetools.TTLCache = cachetools.TTLCache(maxsize=10000, ttl=60)
+_url_cache_lock = threading.Lock()
+
+# Shared across workers through Redis when it is available. Lookups run in
+# the threadpool, so this client is synchronous with short timeouts.
+REDIS_URL_TTL = 300
+_redis_client = redis.from_url(
+    os.getenv("REDIS_URL", "redis://localhost:6379"),
+    decode_responses=True,
+    socket_timeout=0.2,
+    socket_connect_timeout=0.2
+)
+# Skip Redis for a while after a failure so misses don't keep paying timeouts
+_redis_backoff = RedisBackoff()
+
+def _redis_get_url(short_code: str) -> Optional[CachedURL]:
+    if not _redis_backoff.available():
+        return None
+    try:
+        val = _redis_client.get(f"u:{short_code}")
+    except redis.RedisError:
+        _redis_backoff.failed()
+        return None
+    _redis_backoff.succeeded()
+    if val is None:
+        return None
+    return CachedURL(val, short_code)
+
+def _redis_set_url(url: CachedURL) -> None:
+    if not _redis_backoff.available():
+        return
+    try:
+        # Only what a redirect needs; the code itself is in the key
+        _redis_client.setex(f"u:{url.short_code}", REDIS_URL_TTL, url.original_url)
+    except redis.RedisError:
+        _redis_backoff.failed()
+
+@functools.lru_cache(maxsize=4096)
+def _browser_label(ua: str) -> str:
+    """Parse a user agent into a browser label; traffic repeats a few UAs"""
+    parsed = user_agents.parse(ua)
+    return f"{parsed.browser.family} {parsed.browser.version_string}"
 
 class URLService:
     @staticmethod
     def generate_short_code(length: int = 6) -> str:
         """Generate random short code"""
-        characters = string.ascii_letters + string.digits
-        return ''.join(random.choice(characters) for _ in range(length))
+        # Each URL-safe base64 character carries 6 bits of CSPRNG output
+        raw = secrets.token_bytes((length * 6 + 7) // 8)
+        return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()[:length]
     
     @staticmethod
     def create_short_url(db: Session, original_url: str, custom_code: Optional[str] = None, creator_ip: Optional[str] = None) -> URL:
         """Create a new short URL"""
-        if not validators.url(original_url):
+        if not _URL_RE.match(original_url):
             raise ValueError("Invalid URL format")
         
-        # Generate or use custom short code
-        if custom_code:
-            if db.query(URL).filter(URL.short_code == custom_code).first():
-                raise ValueError("Custom code already exists")
-            short_code = custom_code
-        else:
-            # Generate unique short code
-            while True:
-                short_code = URLService.generate_short_code()
-                if not db.query(URL).filter(URL.short_code == short_code).first():
-                    break
+        # Let the unique index on short_code catch collisions instead of
+        # checking for an existing row before every insert
+        attempts = 1 if custom_code else MAX_CODE_ATTEMPTS
+        for _ in range(attempts):
+            short_code = custom_code or URLService.generate_short_code()
+            url_obj = URL(
+                original_url=original_url,
+                short_code=short_code,
+                creator_ip=creator_ip
+            )
+            db.add(url_obj)
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                continue
+            db.refresh(url_obj)
+            with _url_cache_lock:
+                _url_cache.pop(short_code, None)
+            _redis_set_url(CachedURL(original_url=original_url, short_code=short_code))
+            return url_obj
         
-        url_obj = URL(
-            original_url=original_url,
-            short_code=short_code,
-            creator_ip=creator_ip
-        )
-        db.add(url_obj)
-        db.commit()
-        db.refresh(url_obj)
-        return url_obj
+        if custom_code:
+            raise ValueError("Custom code already exists")
+        raise RuntimeError("Could not generate a unique short code")
     
     @staticmethod
-    def get_url_by_code(db: Session, short_code: str) -> Optional[URL]:
-        """Get URL by short code"""
-        return db.query(URL).filter(URL.short_code == short_code, URL.is_active == True).first()
+    def get_url_by_code(db: Session, short_code: str) -> Optional[CachedURL]:
+        """Get URL by short code, served from cache when possible"""
+        with _url_cache_lock:
+            cached = _url_cache.get(short_code)
+        if cached is not None:
+            return cached
+        
+        url = _redis_get_url(short_code)
+        if url is not None:
+            with _url_cache_lock:
+                _url_cache[short_code] = url
+            return url
+        
+        row = db.execute(
+            select(URL.original_url, URL.short_code)
+            .where(URL.short_code == short_code, URL.is_active == True)
+        ).first()
+        if row is None:
+            return None
+        
+        url = CachedURL(*row)
+        with _url_cache_lock:
+            _url_cache[short_code] = url
+        _redis_set_url(url)
+        return url
     
     @staticmethod
-    def increment_click_count(db: Session, short_code: str):
-        """Increment click count for URL"""
-        url = db.query(URL).filter(URL.short_code == short_code).first()
-        if url:
-            url.click_count += 1
-            db.commit()
+    def get_url_details(db: Session, short_code: str) -> Optional[URL]:
+        """Get the full, current URL row by short code"""
+        return db.query(URL).filter(URL.short_code == short_code, URL.is_active == True).first()
 
 class AnalyticsService:
     @staticmethod
-    def track_click(db: Session, short_code: str, ip_address: str, user_agent: str, referer: Optional[str] = None):
+    def track_click(short_code: str, ip_address: str, user_agent: str, referer: Optional[str] = None):
         """Track a click event"""
-        # Parse user agent for browser info
-        ua = user_agents.parse(user_agent)
-        
-        click = Click(
-            short_code=short_code,
-            ip_address=ip_address,
-            user_agent=f"{ua.browser.family} {ua.browser.version_string}",
-            referer=referer,
-            country="Unknown",  # Would need GeoIP database for real location
-            city="Unknown"
-        )
-        db.add(click)
-        db.commit()
-        
-        # Also increment URL click count
-        URLService.increment_click_count(db, short_code)
+        click_buffer.enqueue({
+            "short_code": short_code,
+            "clicked_at": datetime.utcnow(),
+            "ip_address": ip_address,
+            "user_agent": _browser_label(user_agent),
+            "referer": referer,
+            "country": "Unknown",  # Would need GeoIP database for real location
+            "city": "Unknown"
+        })
     
     @staticmethod
     def get_analytics(db: Session, short_code: str) -> Dict:
         """Get analytics for a short URL"""
-        clicks = db.query(Click).filter(Click.short_code == short_code).all()
+        by_code = Click.short_code == short_code
         
-        if not clicks:
+        # Empty IPs map to NULL so COUNT(DISTINCT) skips them like NULLs
+        ip = case((Click.ip_address != "", Click.ip_address))
+        total_clicks, unique_ips = db.execute(
+            select(func.count(), func.count(func.distinct(ip))).where(by_code)
+        ).one()
+        
+        if not total_clicks:
             return {
                 "total_clicks": 0,
                 "unique_ips": 0,
@@ -94,36 +179,31 @@ class AnalyticsService:
                 "browser_stats": []
             }
         
-        # Calculate metrics
-        total_clicks = len(clicks)
-        unique_ips = len(set(click.ip_address for click in clicks if click.ip_address))
-        
-        # Top countries
-        countries = [click.country for click in clicks if click.country]
-        country_counts = Counter(countries).most_common(5)
-        top_countries = [{"country": k, "count": v} for k, v in country_counts]
+        def top(column, label: str) -> List[Dict]:
+            rows = db.execute(
+                select(column, func.count())
+                .where(by_code, column.isnot(None), column != "")
+                .group_by(column)
+                .order_by(desc(func.count()))
+                .limit(5)
+            ).all()
+            return [{label: value, "count": count} for value, count in rows]
         
-        # Top referrers
-        referrers = [click.referer for click in clicks if click.referer]
-        referrer_counts = Counter(referrers).most_common(5)
-        top_referrers = [{"referrer": k, "count": v} for k, v in referrer_counts]
+        # Top countries, referrers and browsers
+        top_countries = top(Click.country, "country")
+        top_referrers = top(Click.referer, "referrer")
+        browser_stats = top(Click.user_agent, "browser")
         
         # Click history (last 30 days by day)
-        now = datetime.utcnow()
-        thirty_days_ago = now - timedelta(days=30)
-        recent_clicks = [c for c in clicks if c.clicked_at >= thirty_days_ago]
-        
-        click_history = {}
-        for click in recent_clicks:
-            date_key = click.clicked_at.date().isoformat()
-            click_history[date_key] = click_history.get(date_key, 0) + 1
-        
-        click_history_list = [{"date": k, "clicks": v} for k, v in sorted(click_history.items())]
-        
-        # Browser stats
-        browsers = [click.user_agent for click in clicks if click.user_agent]
-        browser_counts = Counter(browsers).most_common(5)
-        browser_stats = [{"browser": k, "count": v} for k, v in browser_counts]
+        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+        day = func.date(Click.clicked_at)
+        history_rows = db.execute(
+            select(day, func.count())
+            .where(by_code, Click.clicked_at >= thirty_days_ago)
+            .group_by(day)
+            .order_by(day)
+        ).all()
+        click_history_list = [{"date": str(d), "clicks": c} for d, c in history_rows]
         
         return {
             "total_clicks": total_clicks,
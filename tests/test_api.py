@@ -1,9 +1,12 @@
+import os
+import secrets
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app
-from app.database import Base, get_db
+from app.database import Base, SessionLocal, get_db
+from app.services import MAX_CODE_ATTEMPTS
 
 # Test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -20,6 +23,8 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+# Background click tracking opens its own sessions
+SessionLocal.configure(bind=engine)
 
 client = TestClient(app)
 
@@ -105,6 +110,21 @@ def test_get_url_info():
     assert data["original_url"] == "https://fastapi.tiangolo.com"
     assert data["short_code"] == short_code
 
+def test_get_url_info_click_count():
+    """Test URL info reports clicks made after the lookup was cached"""
+    create_response = client.post(
+        "/shorten",
+        json={"original_url": "https://www.djangoproject.com"}
+    )
+    short_code = create_response.json()["short_code"]
+    
+    client.get(f"/{short_code}", follow_redirects=False)
+    client.get(f"/{short_code}", follow_redirects=False)
+    
+    response = client.get(f"/api/urls/{short_code}")
+    assert response.status_code == 200
+    assert response.json()["click_count"] == 2
+
 def test_get_analytics():
     """Test getting analytics"""
     # Create a short URL first
@@ -141,3 +161,33 @@ def test_nonexistent_analytics():
     """Test analytics for nonexistent short code"""
     response = client.get("/api/analytics/nonexistent")
     assert response.status_code == 404
+
+def post_with_code_bytes(monkeypatch, *values):
+    """Create a URL while secrets.token_bytes returns the given values"""
+    calls = []
+    def token_bytes(n):
+        calls.append(n)
+        return values[min(len(calls), len(values)) - 1]
+    monkeypatch.setattr(secrets, "token_bytes", token_bytes)
+    response = client.post("/shorten", json={"original_url": "https://example.net"})
+    monkeypatch.undo()
+    return response, calls
+
+def test_short_code_collision_retries(monkeypatch):
+    """Test a generated code that collides is retried with a new one"""
+    taken, fresh = os.urandom(5), os.urandom(5)
+    first, _ = post_with_code_bytes(monkeypatch, taken)
+    
+    response, calls = post_with_code_bytes(monkeypatch, taken, fresh)
+    assert response.status_code == 200
+    assert len(calls) == 2
+    assert response.json()["short_code"] != first.json()["short_code"]
+
+def test_short_code_collision_gives_up(monkeypatch):
+    """Test repeated collisions stop after the attempt limit"""
+    taken = os.urandom(5)
+    post_with_code_bytes(monkeypatch, taken)
+    
+    response, calls = post_with_code_bytes(monkeypatch, taken)
+    assert response.status_code == 500
+    assert len(calls) == MAX_CODE_ATTEMPTS
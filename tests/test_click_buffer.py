@@ -0,0 +1,79 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import click_buffer
+from app.database import Base, SessionLocal, URL, Click
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/clicks.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    previous = SessionLocal.kw["bind"]
+    SessionLocal.configure(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([URL(original_url="https://a.com", short_code="a"),
+                     URL(original_url="https://b.com", short_code="b")])
+    session.commit()
+    yield session
+    session.close()
+    SessionLocal.configure(bind=previous)
+    engine.dispose()
+
+def click(short_code):
+    return {
+        "short_code": short_code,
+        "clicked_at": datetime.utcnow(),
+        "ip_address": "127.0.0.1",
+        "user_agent": "Other ",
+        "referer": None,
+        "country": "Unknown",
+        "city": "Unknown"
+    }
+
+def click_counts(db):
+    db.expire_all()
+    return {url.short_code: url.click_count for url in db.query(URL)}
+
+def test_write_batch_aggregates_counters(db):
+    """Test a batch inserts every click and bumps each counter once per click"""
+    click_buffer.write_batch([click("a"), click("b"), click("a")])
+    assert db.query(Click).count() == 3
+    assert click_counts(db) == {"a": 2, "b": 1}
+
+def test_enqueue_writes_through_without_flusher(db):
+    """Test clicks are written directly when the flusher isn't running"""
+    click_buffer.enqueue(click("a"))
+    assert db.query(Click).count() == 1
+    assert click_counts(db) == {"a": 1, "b": 0}
+
+def test_stop_flushes_pending_batch(db):
+    """Test stop() writes rows the flusher is still collecting"""
+    async def scenario():
+        await click_buffer.start()
+        for _ in range(3):
+            # Enqueued from worker threads, as background tasks do
+            await asyncio.to_thread(click_buffer.enqueue, click("a"))
+        await asyncio.sleep(0.02)
+        await click_buffer.stop()
+
+    asyncio.run(scenario())
+    assert db.query(Click).count() == 3
+    assert click_counts(db) == {"a": 3, "b": 0}
+
+def test_flusher_batches_clicks(db):
+    """Test clicks arriving together are flushed while the app keeps running"""
+    async def scenario():
+        await click_buffer.start()
+        for code in ("a", "b", "a"):
+            click_buffer.enqueue(click(code))
+        await asyncio.sleep(click_buffer.FLUSH_INTERVAL * 3)
+        flushed = db.query(Click).count()
+        await click_buffer.stop()
+        return flushed
+
+    assert asyncio.run(scenario()) == 3
+    assert click_counts(db) == {"a": 2, "b": 1}
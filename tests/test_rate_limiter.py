@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Request
+from redis.exceptions import ConnectionError, NoScriptError
+
+from app import middleware, redis_backoff
+from app.middleware import RateLimiter, MEMORY_PRUNE_INTERVAL
+
+WINDOW = 60
+
+def request(ip="1.2.3.4"):
+    return Request({"type": "http", "client": (ip, 12345), "headers": []})
+
+def hit(limiter, now, max_requests=3, ip="1.2.3.4"):
+    limiter._check_memory_rate_limit(ip, now, now - WINDOW, max_requests)
+
+def test_memory_limit_boundary():
+    """Test exactly max_requests are allowed inside one window"""
+    limiter = RateLimiter()
+    for _ in range(3):
+        hit(limiter, 100)
+    with pytest.raises(HTTPException) as exc:
+        hit(limiter, 100)
+    assert exc.value.status_code == 429
+    # Other clients are counted separately
+    hit(limiter, 100, ip="5.6.7.8")
+
+def test_memory_window_expiry():
+    """Test requests older than the window stop counting"""
+    limiter = RateLimiter()
+    for _ in range(3):
+        hit(limiter, 100)
+    with pytest.raises(HTTPException):
+        hit(limiter, 100 + WINDOW - 1)
+    hit(limiter, 100 + WINDOW)
+
+def test_memory_maxlen_follows_max_requests():
+    """Test the per-IP deque is resized when the limit changes"""
+    limiter = RateLimiter()
+    for _ in range(4):
+        hit(limiter, 100, max_requests=5)
+    assert limiter.memory_store["1.2.3.4"].maxlen == 6
+    
+    with pytest.raises(HTTPException):
+        hit(limiter, 100, max_requests=2)
+    requests = limiter.memory_store["1.2.3.4"]
+    assert requests.maxlen == 3
+    assert len(requests) == 3
+    
+    hit(limiter, 101, max_requests=10)
+    assert limiter.memory_store["1.2.3.4"].maxlen == 11
+    assert len(limiter.memory_store["1.2.3.4"]) == 4
+
+def test_memory_prunes_idle_ips():
+    """Test IPs without recent requests are dropped every MEMORY_PRUNE_INTERVAL calls"""
+    limiter = RateLimiter()
+    hit(limiter, 100, ip="idle")
+    hit(limiter, 100 + WINDOW, ip="active")
+    limiter._memory_calls = MEMORY_PRUNE_INTERVAL - 2
+    
+    hit(limiter, 100 + WINDOW, ip="active")
+    assert "idle" in limiter.memory_store
+    hit(limiter, 100 + WINDOW, ip="active")
+    assert set(limiter.memory_store) == {"active"}
+
+class FakeRedis:
+    def __init__(self, result=(1, 1)):
+        self.result = result
+        self.down = False
+        self.scripts = set()
+        self.calls = []
+
+    async def script_load(self, script):
+        if self.down:
+            raise ConnectionError("Redis is down")
+        self.scripts.add("sha")
+        return "sha"
+
+    async def evalsha(self, sha, numkeys, *keys_and_args):
+        self.calls.append(keys_and_args)
+        if self.down:
+            raise ConnectionError("Redis is down")
+        if sha not in self.scripts:
+            raise NoScriptError("NOSCRIPT")
+        return list(self.result)
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(redis_backoff.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(middleware.time, "time", lambda: 6000)
+    return now
+
+@pytest.fixture
+def limiter(clock):
+    limiter = RateLimiter()
+    limiter._client = FakeRedis()
+    return limiter
+
+def test_redis_window_keys(limiter):
+    """Test the script gets the current and previous window counters"""
+    asyncio.run(limiter.check_rate_limit(request(), max_requests=3, window_seconds=WINDOW))
+    assert limiter._client.calls == [("rl:1.2.3.4:100", "rl:1.2.3.4:99", 6000, WINDOW, 3)]
+
+def test_redis_rejects_when_script_denies(limiter):
+    """Test a denied script result becomes a 429"""
+    limiter._client.result = (0, 3)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(limiter.check_rate_limit(request(), max_requests=3, window_seconds=WINDOW))
+    assert exc.value.status_code == 429
+
+def test_redis_reloads_flushed_script(limiter):
+    """Test NOSCRIPT reloads the script and retries"""
+    asyncio.run(limiter.check_rate_limit(request()))
+    limiter._client.scripts.clear()
+    asyncio.run(limiter.check_rate_limit(request()))
+    assert len(limiter._client.calls) == 3
+
+def test_redis_error_falls_back_to_memory_and_backs_off(limiter, clock):
+    """Test a Redis failure uses the memory limiter and skips Redis until the backoff expires"""
+    asyncio.run(limiter.check_rate_limit(request()))
+    client = limiter._client
+    client.down = True
+    
+    asyncio.run(limiter.check_rate_limit(request()))
+    assert len(limiter.memory_store["1.2.3.4"]) == 1
+    calls = len(client.calls)
+    
+    # Still backing off: memory only, Redis untouched
+    asyncio.run(limiter.check_rate_limit(request()))
+    assert len(client.calls) == calls
+    assert len(limiter.memory_store["1.2.3.4"]) == 2
+    
+    client.down = False
+    clock[0] += redis_backoff.REDIS_RETRY_MIN
+    asyncio.run(limiter.check_rate_limit(request()))
+    assert len(client.calls) == calls + 1
+    assert len(limiter.memory_store["1.2.3.4"]) == 2
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+
+import pytest
+from redis.exceptions import ConnectionError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import redis_backoff, services
+from app.redis_backoff import RedisBackoff
+from app.database import Base, Click
+from app.services import AnalyticsService, CachedURL, URLService
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+        self.down = False
+        self.calls = 0
+
+    def get(self, key):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("Redis is down")
+        return self.store.get(key)
+
+    def setex(self, key, ttl, value):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("Redis is down")
+        self.store[key] = value
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(services, "_redis_client", fake)
+    monkeypatch.setattr(services, "_redis_backoff", RedisBackoff())
+    services._url_cache.clear()
+    yield fake
+    services._url_cache.clear()
+
+def test_redis_stores_only_redirect_fields(fake_redis):
+    """Test the shared cache holds just the original URL"""
+    services._redis_set_url(CachedURL("https://example.com", "abc123"))
+    assert fake_redis.store == {"u:abc123": "https://example.com"}
+
+def test_get_url_by_code_served_from_redis(fake_redis):
+    """Test a Redis hit is returned without touching the database"""
+    services._redis_set_url(CachedURL("https://example.com", "abc123"))
+    url = URLService.get_url_by_code(None, "abc123")
+    assert url == CachedURL("https://example.com", "abc123")
+
+def test_redis_skipped_while_backing_off(fake_redis, monkeypatch):
+    """Test a Redis failure stops lookups hitting Redis until the backoff expires"""
+    now = [1000.0]
+    monkeypatch.setattr(redis_backoff.time, "monotonic", lambda: now[0])
+    fake_redis.down = True
+    
+    assert services._redis_get_url("abc123") is None
+    assert fake_redis.calls == 1
+    
+    # Neither reads nor writes touch Redis during the backoff
+    services._redis_get_url("abc123")
+    services._redis_set_url(CachedURL("https://example.com", "abc123"))
+    assert fake_redis.calls == 1
+    
+    fake_redis.down = False
+    now[0] += redis_backoff.REDIS_RETRY_MIN
+    services._redis_set_url(CachedURL("https://example.com", "abc123"))
+    assert fake_redis.calls == 2
+    assert services._redis_get_url("abc123") == CachedURL("https://example.com", "abc123")
+
+def test_backoff_grows_and_resets(monkeypatch):
+    """Test consecutive failures double the backoff up to the cap"""
+    now = [0.0]
+    monkeypatch.setattr(redis_backoff.time, "monotonic", lambda: now[0])
+    backoff = RedisBackoff()
+    
+    for expected in (1, 2, 4):
+        backoff.failed()
+        now[0] += expected - 0.5
+        assert not backoff.available()
+        now[0] += 0.5
+        assert backoff.available()
+    
+    for _ in range(10):
+        backoff.failed()
+    now[0] += redis_backoff.REDIS_RETRY_MAX
+    assert backoff.available()
+    
+    backoff.succeeded()
+    backoff.failed()
+    now[0] += redis_backoff.REDIS_RETRY_MIN
+    assert backoff.available()
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/analytics.db")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+def test_get_analytics_aggregates(db):
+    """Test analytics totals, top-5 lists and daily history from known clicks"""
+    noon = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+    referers = (["r1"] * 6 + ["r2"] * 5 + ["r3"] * 4 + ["r4"] * 3 + ["r5"] * 2
+                + ["r6"] + [None] * 7 + [""] * 7)
+    ips = ["1.1.1.1", "2.2.2.2", "1.1.1.1", "3.3.3.3", "", None]
+    browsers = ["Chrome 120"] * 10 + ["Firefox 121"] * 5 + ["", None] * 10
+    for i, referer in enumerate(referers):
+        days_ago = 1 if i < 20 else 3 if i < 30 else 40
+        db.add(Click(
+            short_code="stats",
+            clicked_at=noon - timedelta(days=days_ago),
+            ip_address=ips[i % len(ips)],
+            user_agent=browsers[i],
+            referer=referer,
+            country="Unknown",
+            city="Unknown"
+        ))
+    # Clicks on other codes must not leak in
+    db.add(Click(short_code="other", ip_address="9.9.9.9", referer="r1", user_agent="Chrome 120"))
+    db.commit()
+    
+    data = AnalyticsService.get_analytics(db, "stats")
+    
+    assert data["total_clicks"] == 35
+    assert data["unique_ips"] == 3
+    assert data["top_countries"] == [{"country": "Unknown", "count": 35}]
+    assert data["top_referrers"] == [
+        {"referrer": "r1", "count": 6},
+        {"referrer": "r2", "count": 5},
+        {"referrer": "r3", "count": 4},
+        {"referrer": "r4", "count": 3},
+        {"referrer": "r5", "count": 2},
+    ]
+    assert data["browser_stats"] == [
+        {"browser": "Chrome 120", "count": 10},
+        {"browser": "Firefox 121", "count": 5},
+    ]
+    # The click from 40 days ago falls outside the 30-day history
+    assert data["click_history"] == [
+        {"date": (noon - timedelta(days=3)).date().isoformat(), "clicks": 10},
+        {"date": (noon - timedelta(days=1)).date().isoformat(), "clicks": 20},
+    ]
+
+def test_get_analytics_no_clicks(db):
+    """Test analytics for a code without clicks is all zeros"""
+    data = AnalyticsService.get_analytics(db, "nothing")
+    assert data["total_clicks"] == 0
+    assert data["unique_ips"] == 0
+    assert data["click_history"] == []